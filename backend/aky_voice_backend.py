@@ -2,96 +2,150 @@
 # -*- coding: utf-8 -*-
 import os
 import struct
-import subprocess
-import requests
-import json
+import asyncio
+import httpx
 import base64
 
 
+TTS_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-preview-tts:generateContent"
+TTS_API_TIMEOUT = 300.0  # วินาที - สคริปต์ยาวใช้เวลาสร้างนาน
+
+
 def run_tts_generation(
     api_key: str, style_instructions: str, main_text: str, voice_name: str,
     output_folder: str, output_filename: str, temperature: float,
     ffmpeg_path: str
 ):
     """
-    ฟังก์ชันหลักสำหรับสร้าง TTS ด้วย Google AI Studio
-    ใช้ REST API เพื่อความเสถียรบน Streamlit Cloud
+    ฟังก์ชันหลักสำหรับสร้าง TTS ด้วย Google AI Studio (แบบ sync)
+    เป็น wrapper บาง ๆ ของ run_tts_generation_async
+    ห้ามเรียกจากโค้ดที่มี event loop ทำงานอยู่ ให้ await run_tts_generation_async แทน
     """
     try:
-        # เตรียม prompt
-        full_prompt = f"""
-        {style_instructions}
-        
-        {main_text}
-        """
-
-        # สร้าง request payload
-        payload = {
-            "contents": [{
-                "parts": [{"text": full_prompt}]
-            }],
-            "generationConfig": {
-                "responseModalities": ["AUDIO"],
-                "speechConfig": {
-                    "voiceConfig": {
-                        "prebuiltVoiceConfig": {
-                            "voiceName": voice_name
-                        }
-                    }
-                }
-            }
-        }
-
-        # เพิ่ม temperature ถ้ามีค่า
-        if temperature != 0.9:  # default value
-            payload["generationConfig"]["temperature"] = temperature
-
-        # สร้างเส้นทางไฟล์
-        wav_path, mp3_path = determine_output_paths(
-            output_folder, output_filename)
-
-        # เรียก REST API
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-preview-tts:generateContent"
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    else:
+        raise ValueError(
+            "run_tts_generation cannot be called from a running event loop; "
+            "await run_tts_generation_async instead.")
+
+    return asyncio.run(run_tts_generation_async(
+        api_key=api_key,
+        style_instructions=style_instructions,
+        main_text=main_text,
+        voice_name=voice_name,
+        output_folder=output_folder,
+        output_filename=output_filename,
+        temperature=temperature,
+        ffmpeg_path=ffmpeg_path
+    ))
+
+
+async def run_tts_generation_async(
+    api_key: str, style_instructions: str, main_text: str, voice_name: str,
+    output_folder: str, output_filename: str, temperature: float,
+    ffmpeg_path: str, client: httpx.AsyncClient = None
+):
+    """
+    สร้าง TTS แบบ async - ใช้ httpx.AsyncClient และ asyncio subprocess
+    ส่ง client เข้ามาเพื่อแชร์ connection pool ระหว่างหลาย request บน event loop เดียว
+    """
+    try:
+        payload = build_tts_payload(style_instructions, main_text, voice_name, temperature)
         headers = {
             "x-goog-api-key": api_key,
             "Content-Type": "application/json"
         }
 
-        response = requests.post(url, headers=headers, json=payload)
+        # เรียก REST API
+        if client is None:
+            async with httpx.AsyncClient() as own_client:
+                response = await own_client.post(
+                    TTS_API_URL, headers=headers, json=payload, timeout=TTS_API_TIMEOUT)
+        else:
+            # กำหนด timeout ต่อ request เพราะ client ที่ส่งมามักใช้ค่า default 5 วินาทีของ httpx
+            response = await client.post(
+                TTS_API_URL, headers=headers, json=payload, timeout=TTS_API_TIMEOUT)
         response.raise_for_status()  # Raise exception for HTTP errors
 
         # ประมวลผล response
-        data = response.json()
-        
-        if (data.get("candidates") and 
-            data["candidates"][0].get("content") and
-            data["candidates"][0]["content"].get("parts") and
-            data["candidates"][0]["content"]["parts"][0].get("inlineData")):
-            
-            # ดึงข้อมูลเสียงที่เป็น base64
-            audio_base64 = data["candidates"][0]["content"]["parts"][0]["inlineData"]["data"]
-            audio_data = base64.b64decode(audio_base64)
+        audio_data = extract_audio_data(response.json())
 
+        # สร้างเส้นทางไฟล์และจองชื่อ MP3 ทันที กันชื่อชนกันเมื่อมีหลาย request พร้อมกัน
+        wav_path, mp3_path = determine_output_paths(
+            output_folder, output_filename)
+
+        try:
             # บันทึกไฟล์ WAV
-            save_pcm_as_wav(wav_path, audio_data)
+            await asyncio.to_thread(save_pcm_as_wav, wav_path, audio_data)
 
             # แปลงเป็น MP3
-            convert_with_ffmpeg(ffmpeg_path, wav_path, mp3_path)
-
+            await convert_with_ffmpeg_async(ffmpeg_path, wav_path, mp3_path)
+        except BaseException:
+            # ล้มเหลวหรือถูกยกเลิก: ลบไฟล์ MP3 ที่จองไว้
+            if os.path.exists(mp3_path):
+                os.remove(mp3_path)
+            raise
+        finally:
             # ลบไฟล์ temporary WAV
             if os.path.exists(wav_path):
                 os.remove(wav_path)
 
-            return mp3_path
-        else:
-            raise ValueError("No audio data received from the API.")
+        return mp3_path
 
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         raise ValueError(f"API Request Error: {str(e)}")
     except Exception as e:
         raise ValueError(f"Backend Error: {str(e)}")
 
 
+def build_tts_payload(style_instructions, main_text, voice_name, temperature):
+    """สร้าง request payload สำหรับ TTS API"""
+    # เตรียม prompt
+    full_prompt = f"""
+        {style_instructions}
+        
+        {main_text}
+        """
+
+    payload = {
+        "contents": [{
+            "parts": [{"text": full_prompt}]
+        }],
+        "generationConfig": {
+            "responseModalities": ["AUDIO"],
+            "speechConfig": {
+                "voiceConfig": {
+                    "prebuiltVoiceConfig": {
+                        "voiceName": voice_name
+                    }
+                }
+            }
+        }
+    }
+
+    # เพิ่ม temperature ถ้ามีค่า
+    if temperature != 0.9:  # default value
+        payload["generationConfig"]["temperature"] = temperature
+
+    return payload
+
+
+def extract_audio_data(data):
+    """ดึงข้อมูลเสียง PCM จาก response ของ API"""
+    if (data.get("candidates") and
+        data["candidates"][0].get("content") and
+        data["candidates"][0]["content"].get("parts") and
+        data["candidates"][0]["content"]["parts"][0].get("inlineData")):
+
+        # ดึงข้อมูลเสียงที่เป็น base64
+        audio_base64 = data["candidates"][0]["content"]["parts"][0]["inlineData"]["data"]
+        return base64.b64decode(audio_base64)
+
+    raise ValueError("No audio data received from the API.")
+
+
 def save_pcm_as_wav(filename, pcm_data, channels=1, rate=24000, sample_width=2):
     """บันทึก PCM data เป็นไฟล์ WAV"""
     import wave
@@ -128,23 +182,35 @@ def create_wav_header(pcm_data, channels=1, rate=24000, sample_width=2):
     return header
 
 
-def convert_with_ffmpeg(ffmpeg_path, wav_path, mp3_path):
-    """แปลงไฟล์ WAV เป็น MP3 ด้วย ffmpeg"""
+async def convert_with_ffmpeg_async(ffmpeg_path, wav_path, mp3_path):
+    """แปลงไฟล์ WAV เป็น MP3 ด้วย ffmpeg (async ไม่บล็อก event loop)"""
+    command = [ffmpeg_path, '-i', wav_path, '-y',
+               '-acodec', 'libmp3lame', '-q:a', '2', mp3_path]
     try:
-        command = [ffmpeg_path, '-i', wav_path, '-y',
-                   '-acodec', 'libmp3lame', '-q:a', '2', mp3_path]
-        result = subprocess.run(command, check=True,
-                                capture_output=True, text=True)
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE)
     except FileNotFoundError:
         raise FileNotFoundError(
             f"FFMPEG not found. Make sure '{ffmpeg_path}' is accessible.")
-    except subprocess.CalledProcessError as e:
+
+    try:
+        stdout, stderr = await process.communicate()
+    except asyncio.CancelledError:
+        process.kill()
+        await process.wait()
+        raise
+
+    if process.returncode != 0:
         raise RuntimeError(
-            f"FFMPEG conversion failed:\nSTDOUT: {e.stdout}\nSTDERR: {e.stderr}")
+            "FFMPEG conversion failed:\n"
+            f"STDOUT: {stdout.decode(errors='replace')}\n"
+            f"STDERR: {stderr.decode(errors='replace')}")
 
 
 def determine_output_paths(folder, filename_base):
-    """สร้างเส้นทางไฟล์ output"""
+    """สร้างเส้นทางไฟล์ output และจองชื่อ MP3 ด้วยไฟล์เปล่า"""
     os.makedirs(folder, exist_ok=True)
     mp3_folder = os.path.join(folder, "MP3_Output")
     os.makedirs(mp3_folder, exist_ok=True)
@@ -156,7 +222,14 @@ def determine_output_paths(folder, filename_base):
     mp3_output = f"{mp3_base_path}.mp3"
 
     counter = 1
-    while os.path.exists(mp3_output):
+    while True:
+        # สร้างไฟล์เปล่าแบบ exclusive เพื่อจองชื่อ (atomic ข้าม thread/process)
+        try:
+            with open(mp3_output, "xb"):
+                pass
+            break
+        except FileExistsError:
+            pass
         wav_output = f"{file_base_path} ({counter}).wav"
         mp3_output = f"{mp3_base_path} ({counter}).mp3"
         counter += 1
@@ -0,0 +1,159 @@
+# File: speculative.py (Speculative Pre-synthesis)
+# -*- coding: utf-8 -*-
+import os
+import asyncio
+import collections
+import threading
+import time
+from concurrent.futures import CancelledError
+
+from backend.aky_voice_backend import run_tts_generation_async
+
+SPECULATIVE_MAX_CONCURRENT = 2  # จำนวนงานล่วงหน้าที่เรียก API พร้อมกันได้ทั้ง process
+SPECULATIVE_HOURLY_BUDGET = 30  # จำนวนครั้งสูงสุดต่อชั่วโมง (ใช้ API key เดียวกันทั้งครอบครัว)
+SPECULATIVE_RESULT_MAX_AGE = 60 * 60  # วินาที - ลบไฟล์ที่สร้างเสร็จแต่ไม่มีใครมารับ (เช่น session ปิดไปแล้ว)
+SPECULATIVE_SWEEP_INTERVAL = 5 * 60  # วินาที
+
+_loop = None
+_semaphore = None
+_loop_lock = threading.Lock()
+_budget_lock = threading.Lock()
+_budget_timestamps = collections.deque()
+_unclaimed_lock = threading.Lock()
+_unclaimed_results = {}  # mp3_path -> เวลาที่สร้างเสร็จ (monotonic)
+
+
+def _get_loop():
+    """สร้าง event loop พื้นหลังหนึ่งตัวสำหรับงานล่วงหน้าทั้งหมด"""
+    global _loop, _semaphore
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            _semaphore = asyncio.Semaphore(SPECULATIVE_MAX_CONCURRENT)
+            threading.Thread(target=_loop.run_forever,
+                             name="speculative-tts", daemon=True).start()
+            _loop.call_soon_threadsafe(_schedule_sweep)
+        return _loop
+
+
+def _schedule_sweep():
+    sweep_unclaimed_results()
+    _loop.call_later(SPECULATIVE_SWEEP_INTERVAL, _schedule_sweep)
+
+
+def sweep_unclaimed_results(max_age: float = None):
+    """ลบไฟล์จากงานล่วงหน้าที่สร้างเสร็จแล้วแต่ไม่ถูก claim ภายในเวลาที่กำหนด"""
+    if max_age is None:
+        max_age = SPECULATIVE_RESULT_MAX_AGE
+    cutoff = time.monotonic() - max_age
+    with _unclaimed_lock:
+        expired = [path for path, finished_at in _unclaimed_results.items()
+                   if finished_at <= cutoff]
+        for path in expired:
+            del _unclaimed_results[path]
+    for path in expired:
+        _remove_file(path)
+
+
+def _take_unclaimed(mp3_path) -> bool:
+    """เอาไฟล์ออกจากรายการรอ claim คืน False ถ้าถูก claim/ลบไปแล้ว"""
+    with _unclaimed_lock:
+        return _unclaimed_results.pop(mp3_path, None) is not None
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def try_consume_budget() -> bool:
+    """หักโควตาหนึ่งครั้ง คืน False ถ้าใช้ครบโควตาของชั่วโมงนี้แล้ว"""
+    now = time.monotonic()
+    with _budget_lock:
+        while _budget_timestamps and now - _budget_timestamps[0] > 3600:
+            _budget_timestamps.popleft()
+        if len(_budget_timestamps) >= SPECULATIVE_HOURLY_BUDGET:
+            return False
+        _budget_timestamps.append(now)
+        return True
+
+
+async def _run_limited(job, kwargs):
+    async with _semaphore:
+        # ตัดสินใจเริ่มงานภายใต้ lock เดียวกับ claim_speculative_job
+        with job['lock']:
+            if job['abandoned']:
+                return None
+            # หักโควตาเฉพาะตอนจะเรียก API จริง งานที่ถูกยกเลิกระหว่างรอคิวไม่เสียโควตา
+            if not try_consume_budget():
+                job['budget_exhausted'] = True
+                return None
+            job['started'] = True
+        mp3_path = await run_tts_generation_async(**kwargs)
+
+        # ตรวจที่ฝั่ง loop: future.cancel() ฝั่ง caller อาจสำเร็จก่อนที่ task จะรู้ตัว
+        # ถ้า task จบในช่องว่างนั้น ผลลัพธ์จะไม่ถูกส่งกลับ จึงต้องลบไฟล์ที่นี่
+        with job['lock']:
+            if job['abandoned']:
+                _remove_file(mp3_path)
+                return None
+            job['result'] = mp3_path
+            with _unclaimed_lock:
+                _unclaimed_results[mp3_path] = time.monotonic()
+        return mp3_path
+
+
+def start_speculative_generation(**kwargs):
+    """
+    เริ่มสร้าง TTS ล่วงหน้าในพื้นหลัง (รับ argument เดียวกับ run_tts_generation_async)
+    คืน job (dict) ที่มี 'future', 'started' และ 'budget_exhausted'
+    """
+    job = {
+        'lock': threading.Lock(),
+        'started': False,
+        'abandoned': False,
+        'budget_exhausted': False,
+        'result': None
+    }
+    job['future'] = asyncio.run_coroutine_threadsafe(_run_limited(job, kwargs), _get_loop())
+    return job
+
+
+def wait_speculative_result(job):
+    """รอผลของงานล่วงหน้า คืน path ของ MP3 หรือ None ถ้างานล้มเหลว/ถูกยกเลิก/โควตาหมด"""
+    try:
+        return job['future'].result()
+    except (CancelledError, Exception):
+        return None
+
+
+def claim_speculative_job(job):
+    """
+    ใช้ผลของงานล่วงหน้าตอนกด Generate
+    ถ้างานยังรอคิวอยู่ (ยังไม่เรียก API) จะยกเลิกแล้วคืน None ให้ผู้ใช้สร้างเองทันที
+    รอเฉพาะงานที่กำลังเรียก API อยู่แล้วเท่านั้น
+    """
+    with job['lock']:
+        if not job['started']:
+            job['abandoned'] = True
+    if job['abandoned']:
+        job['future'].cancel()
+        return None
+    mp3_path = wait_speculative_result(job)
+    if mp3_path and not _take_unclaimed(mp3_path):
+        # ถูก sweep ไปแล้วเพราะค้างนานเกิน SPECULATIVE_RESULT_MAX_AGE
+        return None
+    return mp3_path
+
+
+def discard_speculative_generation(job):
+    """ยกเลิกงานล่วงหน้า ถ้าสร้างเสร็จไปแล้วให้ลบไฟล์ทิ้ง"""
+    # งานที่ยังไม่จบจะลบไฟล์เองใน _run_limited เมื่อเห็น 'abandoned'
+    with job['lock']:
+        job['abandoned'] = True
+        mp3_path = job['result']
+    job['future'].cancel()
+    if mp3_path and _take_unclaimed(mp3_path):
+        _remove_file(mp3_path)
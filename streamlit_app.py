@@ -4,7 +4,15 @@
 import streamlit as st
 import os
 import json
+import html
+import shutil
+import time
+import uuid
 from backend.aky_voice_backend import run_tts_generation
+from backend.speculative import (
+    start_speculative_generation, wait_speculative_result, claim_speculative_job,
+    discard_speculative_generation
+)
 from typing import Dict, Any
 from datetime import datetime
 
@@ -17,6 +25,13 @@ except ImportError:
 
 # --- Configuration ---
 PROFILES_FILE = "profiles_data.json"  # Fallback สำหรับกรณี Supabase ล้ม
+STATIC_AUDIO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "audio")
+STATIC_AUDIO_URL = "/app/static/audio"
+LARGE_AUDIO_BYTES = 5 * 1024 * 1024  # ไฟล์ใหญ่กว่านี้ส่งผ่าน static endpoint แทนการฝังใน session
+STATIC_AUDIO_MAX_AGE = 30 * 60  # วินาที - ไฟล์ใน static เปิดได้โดยไม่ต้องใส่รหัสผ่าน จึงเก็บไว้สั้น ๆ
+STATIC_AUDIO_MIN_BITRATE = 32_000  # bit/s - ใช้ประเมินความยาวเสียงแบบเผื่อไว้ (bitrate ต่ำ = ประเมินยาว)
+TEMP_OUTPUT_FOLDER = "temp_output"
+SPECULATIVE_IDLE_DEFAULT = 5  # วินาทีที่ข้อมูลต้องนิ่งก่อนเริ่มสร้างเสียงล่วงหน้า
 
 
 # --- Supabase Functions ---
@@ -257,6 +272,169 @@ def switch_profile(profile_name: str):
         save_profiles_to_supabase(data_to_save)  # เปลี่ยนจาก save_profiles_to_file()
 
 
+# --- Audio Delivery Functions ---
+def read_audio_bytes(path: str) -> bytes:
+    """อ่านไฟล์เสียงครั้งเดียว ได้ bytes object เดียวไว้แชร์ระหว่าง player และปุ่มดาวน์โหลด"""
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def cleanup_static_audio():
+    """
+    ลบไฟล์เสียงที่หมดอายุใน static folder (Streamlit ปิด static serving ถ้าโฟลเดอร์เกิน 1GB)
+    mtime ของไฟล์ใน static คือเวลาหมดอายุที่ publish_static_audio ตั้งไว้
+    """
+    try:
+        names = os.listdir(STATIC_AUDIO_DIR)
+    except OSError:
+        return
+    now = time.time()
+    for name in names:
+        path = os.path.join(STATIC_AUDIO_DIR, name)
+        try:
+            if name.endswith(".mp3") and os.path.getmtime(path) < now:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def publish_static_audio(path: str) -> str:
+    """
+    วางไฟล์เสียงไว้ใน static folder (hard link ถ้าทำได้) แล้วคืน URL ที่รองรับ byte-range
+    หมายเหตุ: /app/static/ ไม่ผ่านการตรวจรหัสผ่านของแอป ใครมี URL ก็ดาวน์โหลดได้
+    จนกว่าไฟล์จะหมดอายุ (นับจากตอน publish ไม่ใช่ตอนเปิดฟังครั้งล่าสุด):
+    STATIC_AUDIO_MAX_AGE + ความยาวเสียงโดยประมาณ เพื่อไม่ให้ไฟล์ยาวถูกลบระหว่างเล่น
+    """
+    os.makedirs(STATIC_AUDIO_DIR, exist_ok=True)
+
+    # ชื่อแบบสุ่ม เพื่อไม่ให้เดา URL ของไฟล์คนอื่นได้
+    static_name = f"{uuid.uuid4().hex}.mp3"
+    static_path = os.path.join(STATIC_AUDIO_DIR, static_name)
+    try:
+        os.link(path, static_path)
+    except OSError:
+        shutil.copyfile(path, static_path)
+
+    # hard link ได้ mtime ของไฟล์ต้นทาง (ซึ่งอาจเก่ามากถ้ามาจาก speculative)
+    # จึงตั้ง mtime เป็นเวลาหมดอายุเองทั้งสองกรณี
+    playback_seconds = os.path.getsize(static_path) * 8 / STATIC_AUDIO_MIN_BITRATE
+    expires_at = time.time() + STATIC_AUDIO_MAX_AGE + playback_seconds
+    os.utime(static_path, (expires_at, expires_at))
+    return f"{STATIC_AUDIO_URL}/{static_name}"
+
+
+def render_audio_result(path: str):
+    """แสดง player และปุ่มดาวน์โหลด โดยอ่านไฟล์ไม่เกินหนึ่งครั้ง"""
+    file_name = os.path.basename(path)
+    cleanup_static_audio()
+
+    if os.path.getsize(path) > LARGE_AUDIO_BYTES and st.get_option("server.enableStaticServing"):
+        # ไฟล์ใหญ่: ไม่ฝังลง session ให้ browser stream จาก static endpoint แทน
+        try:
+            url = publish_static_audio(path)
+        except OSError:
+            # static folder เขียนไม่ได้ (read-only, ดิสก์เต็ม ฯลฯ) ใช้วิธีฝัง bytes แทน
+            url = None
+        if url:
+            st.audio(url, format='audio/mp3')
+            st.markdown(
+                f'<a href="{url}" download="{html.escape(file_name)}">📥 ดาวน์โหลดไฟล์ MP3</a>',
+                unsafe_allow_html=True
+            )
+            return
+
+    audio_bytes = read_audio_bytes(path)
+    st.audio(audio_bytes, format='audio/mp3')
+    st.download_button(
+        label="📥 ดาวน์โหลดไฟล์ MP3",
+        data=audio_bytes,
+        file_name=file_name,
+        mime="audio/mp3",
+        use_container_width=True
+    )
+
+
+# --- Speculative Pre-synthesis Functions ---
+def get_generation_inputs() -> Dict[str, Any]:
+    """รวบรวมค่าจากฟอร์มที่ใช้สร้างเสียง"""
+    return {
+        'style_instructions': st.session_state.style_input,
+        'main_text': st.session_state.main_text_input,
+        'voice_name': st.session_state.voice_selector.split(' - ')[0],
+        'output_filename': st.session_state.filename_input,
+        'temperature': st.session_state.temp_slider
+    }
+
+
+def get_inputs_signature(inputs: Dict[str, Any]) -> tuple:
+    """สร้าง key สำหรับเทียบว่าข้อมูลเปลี่ยนไปหรือไม่"""
+    return tuple(sorted(inputs.items()))
+
+
+def cancel_speculative_job():
+    """ยกเลิก/ทิ้งงานสร้างล่วงหน้าที่ค้างอยู่"""
+    job = st.session_state.pop('speculative_job', None)
+    if job:
+        discard_speculative_generation(job)
+
+
+def update_speculative_job(api_key: str):
+    """เริ่มงานสร้างล่วงหน้าเมื่อข้อมูลนิ่งครบเวลาที่กำหนด หรือยกเลิกเมื่อข้อมูลเปลี่ยน"""
+    inputs = get_generation_inputs()
+    signature = get_inputs_signature(inputs)
+    now = time.time()
+
+    if signature != st.session_state.get('speculative_signature'):
+        st.session_state.speculative_signature = signature
+        st.session_state.speculative_changed_at = now
+        cancel_speculative_job()
+        return
+
+    if ('speculative_job' in st.session_state
+            or not inputs['main_text'].strip()
+            or signature == st.session_state.get('last_generated_signature')
+            or now - st.session_state.speculative_changed_at < st.session_state.speculative_idle):
+        return
+
+    job = start_speculative_generation(
+        api_key=api_key,
+        output_folder=TEMP_OUTPUT_FOLDER,
+        ffmpeg_path="ffmpeg",
+        **inputs
+    )
+    job['signature'] = signature
+    st.session_state.speculative_job = job
+
+
+def claim_speculative_result(inputs: Dict[str, Any]):
+    """ดึงไฟล์ที่สร้างล่วงหน้าไว้ถ้าตรงกับข้อมูลปัจจุบัน (รอเฉพาะงานที่เรียก API อยู่แล้ว) ไม่งั้นคืน None"""
+    job = st.session_state.pop('speculative_job', None)
+    if not job:
+        return None
+    if job['signature'] != get_inputs_signature(inputs):
+        discard_speculative_generation(job)
+        return None
+    return claim_speculative_job(job)
+
+
+@st.fragment(run_every=1)
+def speculative_watcher(api_key: str):
+    """ตรวจข้อมูลทุกวินาทีและแสดงสถานะการสร้างล่วงหน้า"""
+    update_speculative_job(api_key)
+
+    job = st.session_state.get('speculative_job')
+    if job is None:
+        st.caption("⚡ รอให้ข้อมูลนิ่งก่อนสร้างเสียงล่วงหน้า")
+    elif not job['future'].done():
+        st.caption("⚡ กำลังสร้างเสียงล่วงหน้า..." if job['started'] else "⚡ รอคิวสร้างเสียงล่วงหน้า...")
+    elif wait_speculative_result(job):
+        st.caption("⚡ สร้างเสียงล่วงหน้าเสร็จแล้ว กด Generate เพื่อรับไฟล์ทันที")
+    elif job['budget_exhausted']:
+        st.caption("⏸️ ใช้โควตาสร้างล่วงหน้าครบแล้ว จะสร้างเมื่อกด Generate")
+    else:
+        st.caption("⚠️ สร้างเสียงล่วงหน้าไม่สำเร็จ จะสร้างใหม่เมื่อกด Generate")
+
+
 # --- Password Check Function (เหมือนเดิมทุกอย่าง) ---
 def check_password():
     """Returns `True` if the user had the correct password."""
@@ -297,6 +475,7 @@ st.write("---")
 
 if check_password():
     initialize_profiles()
+    cleanup_static_audio()
 
     # Load API key
     try:
@@ -442,6 +621,23 @@ if check_password():
             )
             st.caption("💾 ข้อมูลจะถูกบันทึกอัตโนมัติเมื่อมีการเปลี่ยนแปลง")
 
+            st.checkbox(
+                "⚡ สร้างเสียงล่วงหน้าอัตโนมัติ (Speculative)",
+                key="speculative_mode",
+                help="เริ่มสร้างเสียงในพื้นหลังเมื่อสคริปต์และการตั้งค่าไม่เปลี่ยนแปลงครบเวลาที่กำหนด"
+            )
+            st.number_input(
+                "รอให้ข้อมูลนิ่งกี่วินาทีก่อนเริ่มสร้าง:",
+                min_value=1, max_value=120,
+                value=SPECULATIVE_IDLE_DEFAULT,
+                key="speculative_idle",
+                disabled=not st.session_state.speculative_mode
+            )
+            if st.session_state.speculative_mode:
+                speculative_watcher(api_key)
+            else:
+                cancel_speculative_job()
+
     st.write("---")
 
     # --- Generate Button (เหมือนเดิมทุกอย่าง) ---
@@ -451,19 +647,18 @@ if check_password():
         else:
             with st.spinner("⏳ กำลังสร้างไฟล์เสียง... กรุณารอสักครู่..."):
                 try:
-                    voice_name_for_api = st.session_state.voice_selector.split(' - ')[0]
-                    temp_output_folder = "temp_output"
-
-                    final_mp3_path = run_tts_generation(
-                        api_key=api_key,
-                        style_instructions=st.session_state.style_input,
-                        main_text=st.session_state.main_text_input,
-                        voice_name=voice_name_for_api,
-                        output_folder=temp_output_folder,
-                        output_filename=st.session_state.filename_input,
-                        temperature=st.session_state.temp_slider,
-                        ffmpeg_path="ffmpeg"
-                    )
+                    generation_inputs = get_generation_inputs()
+
+                    # ใช้ไฟล์ที่สร้างล่วงหน้าไว้ถ้ามี ไม่งั้นสร้างใหม่ตามปกติ
+                    final_mp3_path = claim_speculative_result(generation_inputs)
+                    if final_mp3_path is None:
+                        final_mp3_path = run_tts_generation(
+                            api_key=api_key,
+                            output_folder=TEMP_OUTPUT_FOLDER,
+                            ffmpeg_path="ffmpeg",
+                            **generation_inputs
+                        )
+                    st.session_state.last_generated_signature = get_inputs_signature(generation_inputs)
 
                     # อัปเดต profile หลัง Generate เสร็จ
                     save_to_current_profile('style_instructions', st.session_state.style_input)
@@ -473,16 +668,7 @@ if check_password():
                     save_to_current_profile('filename', st.session_state.filename_input)
 
                     st.success("🎉 สร้างไฟล์เสียงสำเร็จ!")
-                    st.audio(final_mp3_path, format='audio/mp3')
-
-                    with open(final_mp3_path, "rb") as file:
-                        st.download_button(
-                            label="📥 ดาวน์โหลดไฟล์ MP3",
-                            data=file,
-                            file_name=os.path.basename(final_mp3_path),
-                            mime="audio/mp3",
-                            use_container_width=True
-                        )
+                    render_audio_result(final_mp3_path)
                 except Exception as e:
                     st.error(f"❌ เกิดข้อผิดพลาด: {e}")
                     with st.expander("🔍 ดูรายละเอียด Error"):
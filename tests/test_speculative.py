@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import base64
+import os
+import time
+
+import httpx
+import pytest
+
+from backend import speculative
+
+FAKE_FFMPEG_SCRIPT = """#!/bin/sh
+for last; do :; done
+cp "$2" "$last"
+"""
+
+
+@pytest.fixture
+def fake_ffmpeg(tmp_path):
+    path = tmp_path / "ffmpeg"
+    path.write_text(FAKE_FFMPEG_SCRIPT)
+    path.chmod(0o755)
+    return str(path)
+
+
+@pytest.fixture(autouse=True)
+def reset_budget():
+    speculative._budget_timestamps.clear()
+    yield
+    speculative._budget_timestamps.clear()
+
+
+def make_client(calls, delay=0.0):
+    async def handler(request):
+        calls.append(request)
+        await asyncio.sleep(delay)
+        audio = base64.b64encode(b"\0" * 4800).decode()
+        return httpx.Response(200, json={
+            "candidates": [{"content": {"parts": [{"inlineData": {"data": audio}}]}}]
+        })
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+def start_job(tmp_path, fake_ffmpeg, client, name="clip"):
+    return speculative.start_speculative_generation(
+        api_key="test-key", style_instructions="", main_text="hello",
+        voice_name="Puck", output_folder=str(tmp_path / "out"),
+        output_filename=name, temperature=0.9, ffmpeg_path=fake_ffmpeg,
+        client=client)
+
+
+def test_claim_waits_for_started_job(tmp_path, fake_ffmpeg):
+    calls = []
+    job = start_job(tmp_path, fake_ffmpeg, make_client(calls, delay=0.2))
+    while not job['started']:
+        time.sleep(0.01)
+
+    mp3_path = speculative.claim_speculative_job(job)
+    assert mp3_path and os.path.getsize(mp3_path) > 0
+    assert len(calls) == 1
+
+
+def test_queued_job_is_cancelled_without_using_budget(tmp_path, fake_ffmpeg):
+    calls = []
+    client = make_client(calls, delay=0.5)
+    running = [start_job(tmp_path, fake_ffmpeg, client, f"busy{i}")
+               for i in range(speculative.SPECULATIVE_MAX_CONCURRENT)]
+    queued = start_job(tmp_path, fake_ffmpeg, client, "queued")
+    while not all(job['started'] for job in running):
+        time.sleep(0.01)
+
+    start = time.perf_counter()
+    assert speculative.claim_speculative_job(queued) is None
+    assert time.perf_counter() - start < 0.1
+
+    for job in running:
+        assert speculative.wait_speculative_result(job)
+    assert len(speculative._budget_timestamps) == speculative.SPECULATIVE_MAX_CONCURRENT
+    assert len(calls) == speculative.SPECULATIVE_MAX_CONCURRENT
+
+
+def test_exhausted_budget_skips_api_call(tmp_path, fake_ffmpeg, monkeypatch):
+    monkeypatch.setattr(speculative, "SPECULATIVE_HOURLY_BUDGET", 0)
+    calls = []
+    job = start_job(tmp_path, fake_ffmpeg, make_client(calls))
+
+    assert speculative.wait_speculative_result(job) is None
+    assert job['budget_exhausted']
+    assert calls == []
+
+
+def test_discard_removes_finished_file(tmp_path, fake_ffmpeg):
+    job = start_job(tmp_path, fake_ffmpeg, make_client([]))
+    mp3_path = speculative.wait_speculative_result(job)
+    assert os.path.exists(mp3_path)
+
+    speculative.discard_speculative_generation(job)
+    assert not os.path.exists(mp3_path)
+
+
+def test_job_abandoned_while_finishing_removes_file(tmp_path, monkeypatch):
+    release = asyncio.Event()
+    produced = []
+
+    async def fake_generation(**kwargs):
+        mp3_path = str(tmp_path / "late.mp3")
+        open(mp3_path, "wb").close()
+        produced.append(mp3_path)
+        await release.wait()
+        return mp3_path
+
+    monkeypatch.setattr(speculative, "run_tts_generation_async", fake_generation)
+    job = speculative.start_speculative_generation()
+    while not produced:
+        time.sleep(0.01)
+
+    # future.cancel() จะไม่ทันหยุด task ที่จบแล้ว จำลองด้วยการตั้ง flag อย่างเดียว
+    with job['lock']:
+        job['abandoned'] = True
+    speculative._get_loop().call_soon_threadsafe(release.set)
+
+    assert speculative.wait_speculative_result(job) is None
+    assert not os.path.exists(produced[0])
+
+
+def test_sweep_removes_unclaimed_results(tmp_path, fake_ffmpeg):
+    job = start_job(tmp_path, fake_ffmpeg, make_client([]))
+    mp3_path = speculative.wait_speculative_result(job)
+    assert os.path.exists(mp3_path)
+
+    speculative.sweep_unclaimed_results(max_age=0)
+    assert not os.path.exists(mp3_path)
+    assert speculative.claim_speculative_job(job) is None
@@ -0,0 +1,425 @@
+# File: load_test.py (Concurrent Session Load Test)
+# -*- coding: utf-8 -*-
+"""
+ทดสอบโหลดของ streamlit_app.py ด้วย Streamlit AppTest
+
+จำลองสมาชิกในครอบครัว N คนพร้อมกัน แต่ละคนเดิน flow จริงของแอป:
+ใส่รหัสผ่าน -> สร้าง/สลับ Profile -> แก้สคริปต์ -> Generate -> ดาวน์โหลด
+โดย stub เฉพาะ Supabase, ชั้น HTTP ของ TTS API (httpx.MockTransport) และ ffmpeg
+ส่วน run_tts_generation จริงยังทำงานครบ (ตั้งชื่อไฟล์, เขียน WAV, ลบไฟล์ชั่วคราว)
+AppTest ใช้ Runtime แบบ singleton ต่อ process จึงรันแต่ละ session ใน process แยก
+แต่ใช้ temp_output ร่วมกันเหมือนบน container จริง และโหลด .streamlit/config.toml ของ repo
+(static serving) เพื่อให้ไฟล์ใหญ่วิ่งผ่าน delivery path เดียวกับ production
+ข้อจำกัด: ไม่ได้จำลองการแย่ง GIL / speculative event loop / media manager ภายใน process เดียว
+จึงรายงานหน่วยความจำเป็นผลรวมและค่าประมาณของ process เดียวแทน
+แล้วเพิ่มจำนวน session ทีละขั้น พร้อมรายงาน latency, error rate,
+การเติบโตของดิสก์/หน่วยความจำ และไฟล์ output ที่ชนกัน
+
+ตัวอย่าง:
+    python tools/load_test.py --levels 1,4,16,32 --tts-latency 2.0
+"""
+import argparse
+import asyncio
+import base64
+import os
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import types
+from multiprocessing import Pool
+
+import httpx
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    tomllib = None
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(REPO_ROOT, "streamlit_app.py")
+APP_CONFIG_PATH = os.path.join(REPO_ROOT, ".streamlit", "config.toml")
+STATIC_AUDIO_DIR = os.path.join(REPO_ROOT, "static", "audio")
+sys.path.insert(0, REPO_ROOT)
+
+from streamlit import config as st_config  # noqa: E402
+from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+APP_PASSWORD = "load-test-family"
+GENERATE_LABEL = "🚀 สร้างไฟล์เสียง (Generate Audio)"
+ADD_PROFILE_LABEL = "➕ Add Profile"
+
+
+# --- Stubs ---
+class FakeSupabase:
+    """Supabase client ในหน่วยความจำ รองรับเฉพาะ query ที่ streamlit_app.py ใช้"""
+
+    def __init__(self):
+        self.rows = []
+        self.lock = threading.Lock()
+
+    def table(self, name):
+        return _FakeQuery(self)
+
+
+class _FakeQuery:
+    def __init__(self, db):
+        self.db = db
+        self.filters = {}
+        self.action = "select"
+        self.values = None
+
+    def select(self, *args, **kwargs):
+        self.action = "select"
+        return self
+
+    def update(self, values):
+        self.action, self.values = "update", values
+        return self
+
+    def insert(self, values):
+        self.action, self.values = "insert", values
+        return self
+
+    def eq(self, column, value):
+        self.filters[column] = value
+        return self
+
+    def execute(self):
+        with self.db.lock:
+            matched = [row for row in self.db.rows
+                       if all(row.get(k) == v for k, v in self.filters.items())]
+            if self.action == "update":
+                for row in matched:
+                    row.update(self.values)
+            elif self.action == "insert":
+                row = dict(self.values, id=len(self.db.rows) + 1)
+                self.db.rows.append(row)
+                matched = [row]
+            data = [dict(row) for row in matched]
+        return types.SimpleNamespace(data=data, count=len(data))
+
+
+FAKE_FFMPEG_SCRIPT = """#!/bin/sh
+# ffmpeg จำลอง: คัดลอก input (-i) ไปยัง output (argument ตัวสุดท้าย)
+for last; do :; done
+cp "$2" "$last"
+"""
+
+
+def install_fake_ffmpeg(workdir: str):
+    """สร้าง ffmpeg จำลองและใส่ไว้หน้า PATH (แอปเรียก "ffmpeg" ตรง ๆ)"""
+    bin_dir = os.path.join(workdir, "bin")
+    os.makedirs(bin_dir, exist_ok=True)
+    script_path = os.path.join(bin_dir, "ffmpeg")
+    with open(script_path, "w") as f:
+        f.write(FAKE_FFMPEG_SCRIPT)
+    os.chmod(script_path, 0o755)
+    os.environ["PATH"] = bin_dir + os.pathsep + os.environ.get("PATH", "")
+
+
+def install_stubs(tts_latency: float, audio_bytes: int):
+    """แทนที่ Supabase และชั้น HTTP ของ TTS API ด้วย stub (มีผลทั้ง process)"""
+    fake_db = FakeSupabase()
+    fake_module = types.ModuleType("supabase")
+    fake_module.create_client = lambda url, key: fake_db
+    fake_module.Client = FakeSupabase
+    sys.modules["supabase"] = fake_module
+
+    audio_base64 = base64.b64encode(os.urandom(audio_bytes)).decode()
+
+    async def fake_tts_api(request):
+        await asyncio.sleep(tts_latency)
+        return httpx.Response(200, json={
+            "candidates": [{"content": {"parts": [
+                {"inlineData": {"mimeType": "audio/L16;rate=24000", "data": audio_base64}}
+            ]}}]
+        })
+
+    class MockAsyncClient(httpx.AsyncClient):
+        def __init__(self, *args, **kwargs):
+            kwargs["transport"] = httpx.MockTransport(fake_tts_api)
+            super().__init__(*args, **kwargs)
+
+    # backend สร้าง httpx.AsyncClient เอง จึงสลับ class ที่ระดับ module (เฉพาะ worker process)
+    httpx.AsyncClient = MockAsyncClient
+
+    load_app_config()
+    track_media_storage()
+    return fake_db
+
+
+def load_app_config():
+    """โหลด .streamlit/config.toml ของ repo (workdir ของ load test ไม่มี config นี้)"""
+    if tomllib is None:
+        st_config.set_option("server.enableStaticServing", True)
+        return
+    with open(APP_CONFIG_PATH, "rb") as f:
+        app_config = tomllib.load(f)
+    for section, options in app_config.items():
+        for name, value in options.items():
+            st_config.set_option(f"{section}.{name}", value)
+
+
+# bytes ที่ถูกเก็บใน media storage ของ session นี้ (key = id ของ object ไม่นับซ้ำถ้าแชร์กัน)
+_media_objects = {}
+
+
+def track_media_storage():
+    """นับหน่วยความจำที่ st.audio / st.download_button ฝังไว้ใน media storage"""
+    original = MemoryMediaFileStorage.load_and_get_id
+
+    def load_and_get_id(self, path_or_data, mimetype, kind, filename=None):
+        file_id = original(self, path_or_data, mimetype, kind, filename)
+        content = self._files_by_id[file_id].content
+        _media_objects[id(content)] = content
+        return file_id
+
+    MemoryMediaFileStorage.load_and_get_id = load_and_get_id
+
+
+def media_storage_mb() -> float:
+    return sum(len(content) for content in _media_objects.values()) / 1024 ** 2
+
+
+# --- Measurements ---
+def current_rss_mb() -> float:
+    """RSS ปัจจุบันของ process (MB) - fallback เป็นค่า peak ถ้าไม่มี /proc"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+def folder_size_mb(folder: str) -> float:
+    """ขนาดรวมของไฟล์ในโฟลเดอร์ (MB)"""
+    total = 0
+    for root, _, files in os.walk(folder):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total / 1024 ** 2
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+# --- Session Flow ---
+def _run(at: AppTest, timings: dict, step: str):
+    start = time.perf_counter()
+    at.run()
+    timings[step] = time.perf_counter() - start
+    if at.exception:
+        raise RuntimeError(f"{step}: {at.exception[0].message}")
+
+
+def _button(at: AppTest, label: str):
+    for button in at.button:
+        if button.label == label:
+            return button
+    raise RuntimeError(f"Button not found: {label}")
+
+
+def run_session(session_id: int, timeout: float) -> dict:
+    """เดิน flow ของผู้ใช้หนึ่งคน คืนค่า timing และ error (ถ้ามี)"""
+    timings = {}
+    result = {"session": session_id, "timings": timings, "error": None, "mp3": None}
+    rss_before = current_rss_mb()
+    start = time.perf_counter()
+    try:
+        at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        at.secrets["APP_PASSWORD"] = APP_PASSWORD
+        at.secrets["GOOGLE_API_KEY"] = "load-test-key"
+        at.secrets["SUPABASE_URL"] = "http://supabase.invalid"
+        at.secrets["SUPABASE_KEY"] = "load-test-key"
+        _run(at, timings, "load")
+
+        # 1. Password
+        at.text_input(key="password").input(APP_PASSWORD)
+        _run(at, timings, "password")
+
+        # 2. Profile switch
+        profile_name = f"Session {session_id}"
+        at.text_input(key="new_profile_input").input(profile_name)
+        _button(at, ADD_PROFILE_LABEL).click()
+        _run(at, timings, "add_profile")
+        at.selectbox(key="profile_selector").select(profile_name)
+        _run(at, timings, "switch_profile")
+
+        # 3. Edit
+        at.text_area(key="style_input").input("พูดด้วยน้ำเสียงสดใส")
+        at.text_area(key="main_text_input").input(f"สคริปต์ทดสอบโหลดของ session {session_id}")
+        at.text_input(key="filename_input").input("load_test")
+        _run(at, timings, "edit")
+
+        # 4. Generate
+        _button(at, GENERATE_LABEL).click()
+        _run(at, timings, "generate")
+        if at.error:
+            raise RuntimeError(f"generate: {at.error[0].value}")
+
+        # 5. Download (ไฟล์ใหญ่ใช้ลิงก์ static แทน st.download_button)
+        static_links = [m for m in at.markdown if 'download="' in m.value]
+        downloads = at.get("download_button")
+        if static_links:
+            result["delivery"] = "static"
+        elif downloads:
+            result["delivery"] = "embedded"
+            result["mp3"] = downloads[0].proto.url
+        else:
+            raise RuntimeError("download: no download button or static link rendered")
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["total"] = time.perf_counter() - start
+    result["rss_before_mb"] = rss_before
+    result["rss_mb"] = current_rss_mb()
+    result["rss_growth_mb"] = result["rss_mb"] - rss_before
+    result["media_mb"] = media_storage_mb()
+    return result
+
+
+# --- Ramp ---
+def _session_worker(args):
+    session_id, timeout = args
+    return run_session(session_id, timeout)
+
+
+def run_level(concurrency: int, timeout: float, output_folder: str,
+              tts_latency: float, audio_bytes: int) -> dict:
+    """รัน session พร้อมกัน N ตัว (process ละหนึ่ง session) แล้วสรุปผล"""
+    disk_before = folder_size_mb(output_folder) + folder_size_mb(STATIC_AUDIO_DIR)
+    files_before = set(_list_mp3(output_folder))
+
+    started = time.perf_counter()
+    with Pool(processes=concurrency, initializer=install_stubs,
+              initargs=(tts_latency, audio_bytes), maxtasksperchild=1) as pool:
+        results = pool.map(_session_worker,
+                           [(i, timeout) for i in range(concurrency)], chunksize=1)
+    wall = time.perf_counter() - started
+
+    new_files = set(_list_mp3(output_folder)) - files_before
+    ok = [r for r in results if not r["error"]]
+    generate_times = [r["timings"]["generate"] for r in ok]
+    totals = [r["total"] for r in ok]
+    return {
+        "concurrency": concurrency,
+        "ok": len(ok),
+        "errors": len(results) - len(ok),
+        "error_rate": (len(results) - len(ok)) / len(results),
+        "error_samples": sorted({r["error"] for r in results if r["error"]})[:3],
+        "wall": wall,
+        "total_p50": statistics.median(totals) if totals else 0.0,
+        "total_p95": percentile(totals, 95),
+        "generate_p50": statistics.median(generate_times) if generate_times else 0.0,
+        "generate_p95": percentile(generate_times, 95),
+        # จำนวน generate ที่สำเร็จแต่ไฟล์ใหม่ไม่ครบ = ถูกเขียนทับกันใน temp_output
+        "collisions": max(0, len(ok) - len(new_files)),
+        "disk_mb": folder_size_mb(output_folder) + folder_size_mb(STATIC_AUDIO_DIR) - disk_before,
+        "static": sum(1 for r in ok if r.get("delivery") == "static"),
+        # media storage ที่แต่ละ session ฝังไว้ในหน่วยความจำของ server
+        "media_mb": statistics.mean(r["media_mb"] for r in results),
+        "rss_sum_mb": sum(r["rss_mb"] for r in results),
+        "rss_growth_mb": statistics.mean(r["rss_growth_mb"] for r in results),
+        # ประมาณ process เดียวที่รับทุก session: baseline หนึ่งตัว + ส่วนที่แต่ละ session เพิ่ม
+        "projected_mb": (min(r["rss_before_mb"] for r in results)
+                         + sum(r["rss_growth_mb"] for r in results)),
+    }
+
+
+def _list_mp3(folder: str):
+    mp3_folder = os.path.join(folder, "MP3_Output")
+    if not os.path.isdir(mp3_folder):
+        return []
+    return os.listdir(mp3_folder)
+
+
+def print_report(row: dict):
+    print(
+        f"{row['concurrency']:>5} | {row['ok']:>4} | {row['error_rate']:>6.1%} | "
+        f"{row['total_p50']:>7.2f} | {row['total_p95']:>7.2f} | "
+        f"{row['generate_p50']:>7.2f} | {row['generate_p95']:>7.2f} | "
+        f"{row['collisions']:>4} | {row['static']:>6} | {row['disk_mb']:>8.2f} | "
+        f"{row['media_mb']:>8.2f} | {row['rss_growth_mb']:>8.1f} | "
+        f"{row['rss_sum_mb']:>8.1f} | {row['projected_mb']:>8.1f}"
+    )
+    for sample in row["error_samples"]:
+        print(f"      ! {sample}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent-session load test for streamlit_app.py")
+    parser.add_argument("--levels", default="1,2,4,8,16",
+                        help="ระดับ concurrency คั่นด้วย comma (default: 1,2,4,8,16)")
+    parser.add_argument("--tts-latency", type=float, default=1.0,
+                        help="เวลาตอบกลับจำลองของ TTS API ต่อครั้ง (วินาที)")
+    parser.add_argument("--audio-kb", type=int, default=512,
+                        help="ขนาดเสียง PCM ที่ API จำลองส่งกลับ (KB)")
+    parser.add_argument("--real-ffmpeg", action="store_true",
+                        help="ใช้ ffmpeg จริงในเครื่อง (วัดภาระการ encode ด้วย)")
+    parser.add_argument("--timeout", type=float, default=120.0,
+                        help="timeout ต่อหนึ่ง rerun (วินาที)")
+    parser.add_argument("--max-error-rate", type=float, default=0.05,
+                        help="หยุด ramp เมื่อ error rate เกินค่านี้")
+    parser.add_argument("--max-p95", type=float, default=30.0,
+                        help="หยุด ramp เมื่อ p95 ของทั้ง flow เกินค่านี้ (วินาที)")
+    parser.add_argument("--keep-workdir", action="store_true",
+                        help="ไม่ลบโฟลเดอร์ทำงานหลังทดสอบเสร็จ")
+    args = parser.parse_args(argv)
+
+    levels = [int(level) for level in args.levels.split(",") if level.strip()]
+
+    # แอปเขียน temp_output และ profiles_data.json แบบ relative path จึงรันใน workdir แยก
+    workdir = tempfile.mkdtemp(prefix="aky_load_test_")
+    original_cwd = os.getcwd()
+    os.chdir(workdir)
+    output_folder = os.path.join(workdir, "temp_output")
+    if not args.real_ffmpeg:
+        install_fake_ffmpeg(workdir)
+    print(f"Workdir: {workdir}")
+    print("static = sessions served via /app/static, media MB = bytes embedded in media storage per session")
+    print("RSS +MB = RSS growth per session, RSS sum = all worker processes, 1-proc MB = baseline + sum of growth")
+    print("NOTE: each session runs in its own process; contention inside one Streamlit process")
+    print("      (GIL, speculative event loop, media file manager) is NOT modelled.")
+    print("  sess |   ok |   err % |   p50 s |   p95 s |  gen p50 |  gen p95 | coll | static |  disk MB "
+          "| media MB |  RSS +MB |  RSS sum | 1-proc MB")
+
+    static_before = set(os.listdir(STATIC_AUDIO_DIR)) if os.path.isdir(STATIC_AUDIO_DIR) else set()
+    capacity = None
+    try:
+        for level in levels:
+            row = run_level(level, args.timeout, output_folder,
+                            args.tts_latency, args.audio_kb * 1024)
+            print_report(row)
+            if row["error_rate"] > args.max_error_rate or row["total_p95"] > args.max_p95:
+                print(f"Capacity limit reached at {level} concurrent sessions.")
+                break
+            capacity = level
+    finally:
+        os.chdir(original_cwd)
+        # ไฟล์ static ถูกวางไว้ใน repo จริง (ข้าง streamlit_app.py) จึงลบเฉพาะที่ load test สร้าง
+        if os.path.isdir(STATIC_AUDIO_DIR):
+            for name in set(os.listdir(STATIC_AUDIO_DIR)) - static_before:
+                os.remove(os.path.join(STATIC_AUDIO_DIR, name))
+        if not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"Highest healthy level: {capacity if capacity is not None else 'none'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())